@@ -10,59 +10,176 @@ Usage:
 
 Note: After installing `playwright`, run `python -m playwright install` to install browser binaries.
 """
-from collections import defaultdict
+from collections import defaultdict, deque
 import json
 import csv
 import time
 import argparse
+from operator import itemgetter
 
-from playwright.async_api import async_playwright
+import split_by_sector
 
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
 
-def find_companies_list(obj):
-    if isinstance(obj, list) and obj and isinstance(obj[0], dict):
-        keys = set(k.lower() for k in obj[0].keys())
-        if keys & {"name", "title", "nom", "company"}:
-            return obj
+try:
+    import orjson
 
-    if isinstance(obj, dict):
-        for k, v in obj.items():
-            found = find_companies_list(v)
-            if found:
-                return found
+    json_loads = orjson.loads
 
-    if isinstance(obj, list):
-        for item in obj:
-            found = find_companies_list(item)
-            if found:
-                return found
+    def json_dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+except ImportError:
+    # orjson is optional; fall back to the stdlib json module
+    json_loads = json.loads
+
+    def json_dumps(obj) -> str:
+        return json.dumps(obj, ensure_ascii=False)
+
+
+TARGET_KEYS = frozenset({"name", "title", "nom", "company"})
+
+
+def find_companies_list(root):
+    # iterative DFS with an explicit stack; console payloads can be deeply nested
+    # and, once Playwright rebuilds them, cyclic
+    stack = deque([root])
+    seen = set()
+    while stack:
+        o = stack.pop()
+        if type(o) is list or type(o) is dict:
+            if id(o) in seen:
+                continue
+            seen.add(id(o))
+        if type(o) is list:
+            if o and type(o[0]) is dict and not TARGET_KEYS.isdisjoint(k.lower() for k in o[0]):
+                return o
+            stack.extend(reversed(o))
+        elif type(o) is dict:
+            stack.extend(reversed(list(o.values())))
 
     return None
 
 
+def find_largest_dict_list(root):
+    # fallback heuristic: longest list whose elements are all dicts
+    best = None
+    stack = deque([root])
+    seen = set()
+    while stack:
+        o = stack.pop()
+        if type(o) is list or type(o) is dict:
+            if id(o) in seen:
+                continue
+            seen.add(id(o))
+        if type(o) is list:
+            if o and all(type(x) is dict for x in o):
+                if best is None or len(o) > len(best):
+                    best = o
+                continue
+            stack.extend(o)
+        elif type(o) is dict:
+            stack.extend(o.values())
+
+    return best
+
+
+# Subresources that never carry the company payload; aborting them keeps page load
+# off images/fonts/trackers.
+BLOCKED_RESOURCE_TYPES = frozenset({"image", "media", "font", "stylesheet"})
+BLOCKED_URL_PARTS = ("google-analytics", "googletagmanager")
+
+
+async def block_subresources(route):
+    request = route.request
+    if request.resource_type in BLOCKED_RESOURCE_TYPES or any(p in request.url for p in BLOCKED_URL_PARTS):
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+class Finder:
+    """Scan console payloads as they arrive instead of buffering them all.
+
+    A list matching TARGET_KEYS wins; otherwise the longest list of dicts seen,
+    then a match inside a JSON-encoded string.
+    """
+
+    def __init__(self):
+        self.found = None
+        self.largest = None
+        self.from_text = None
+        self.count = 0
+        # set once `found` is filled so waiters can stop early
+        self.done = asyncio.Event()
+
+    def feed(self, val):
+        if self.found is not None or val is None:
+            return
+        self.count += 1
+        if isinstance(val, str):
+            if self.from_text is None:
+                try:
+                    obj = json_loads(val)
+                except Exception:
+                    return
+                self.from_text = find_companies_list(obj)
+            return
+        found = find_companies_list(val)
+        if found:
+            self.found = found
+            self.done.set()
+            return
+        # val might be a list of args (e.g., ["label", [...objects...]
+        # or nested lists/objects. Traverse to find inner lists.
+        candidate = find_largest_dict_list(val)
+        if candidate and (self.largest is None or len(candidate) > len(self.largest)):
+            self.largest = candidate
+
+
+# output field -> accepted source keys (lowercased), in order of preference
+FIELD_ALIASES = {
+    "name": ("name", "title", "nom", "company"),
+    "secteur": ("secteur", "sector", "categorie", "category"),
+    "website": ("website", "site", "url"),
+    "description": ("description", "desc", "resume"),
+}
+KEY_MAP = {alias: (field, rank) for field, aliases in FIELD_ALIASES.items() for rank, alias in enumerate(aliases)}
+
+
 def normalize_company(rec: dict) -> dict:
-    lower = {k.lower(): v for k, v in rec.items()}
-    name = lower.get("name") or lower.get("title") or lower.get("nom") or lower.get("company") or ""
-    secteur = lower.get("secteur") or lower.get("sector") or lower.get("categorie") or lower.get("category") or ""
-    website = lower.get("website") or lower.get("site") or lower.get("url") or ""
-    description = lower.get("description") or lower.get("desc") or lower.get("resume") or ""
-    return {
-        "name": name,
-        "secteur": secteur,
-        "website": website,
-        "description": description,
-        "raw": json.dumps(rec, ensure_ascii=False),
-    }
+    # one pass over the record, routing each key to its output field; a
+    # preferred alias wins over a later one regardless of key order
+    out = {"name": "", "secteur": "", "website": "", "description": ""}
+    ranks = {}
+    for k, v in rec.items():
+        hit = KEY_MAP.get(k.lower())
+        if hit is None or not v:
+            continue
+        field, rank = hit
+        if rank < ranks.get(field, len(KEY_MAP)):
+            ranks[field] = rank
+            out[field] = v
+    out["raw"] = json_dumps(rec)
+    return out
 
 
 def write_csv(companies: list, out_path: str):
-    companies_sorted = sorted(companies, key=lambda c: (c.get("secteur") or "", c.get("name") or ""))
+    # group by sector first, then only sort each (small) bucket by name
+    buckets = defaultdict(list)
+    try:
+        for c in companies:
+            buckets[c["secteur"]].append(c)
+        by_name = itemgetter("name")
+        companies_sorted = [c for secteur in sorted(buckets) for c in sorted(buckets[secteur], key=by_name)]
+    except TypeError:
+        # sector values that can't be dict keys (e.g. a list-valued category)
+        companies_sorted = sorted(companies, key=itemgetter("secteur", "name"))
     fieldnames = ["secteur", "name", "description", "website", "raw"]
-    with open(out_path, "w", encoding="utf-8", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        for c in companies_sorted:
-            writer.writerow({k: c.get(k, "") for k in fieldnames})
+    rows = [[c[k] for k in fieldnames] for c in companies_sorted]
+    with open(out_path, "w", encoding="utf-8", newline="", buffering=1 << 20) as f:
+        writer = csv.writer(f)
+        writer.writerow(fieldnames)
+        writer.writerows(rows)
 
 
 import asyncio
@@ -71,13 +188,15 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--url", default="https://www.technopark.ma/start-ups-du-mois/")
     parser.add_argument("--output", default="companies.csv")
+    parser.add_argument("--pipeline", action="store_true",
+                        help=f"Write per-sector CSVs to {split_by_sector.OUT_DIR}/ directly instead of companies.csv")
     args = parser.parse_args()
 
     asyncio.run(run_playwright(args))
 
 
 async def run_playwright(args):
-    captured = []
+    finder = Finder()
 
     async with async_playwright() as p:
         browser = await p.chromium.launch(headless=True)
@@ -89,11 +208,34 @@ async def run_playwright(args):
         (() => {
             window.__captured_console = window.__captured_console || [];
             const orig = console.log.bind(console);
+            // snapshot each argument with the native structured clone; fall back
+            // to a JSON round trip for what it rejects (functions, DOM nodes,
+            // Proxy-wrapped state) and for shared or circular references, which
+            // structuredClone would keep but JSON duplicates or refuses
+            const clone = (typeof structuredClone === 'function') ? structuredClone : (a => a);
+            const isTree = (root) => {
+                const seen = new Set();
+                const stack = [root];
+                while (stack.length) {
+                    const o = stack.pop();
+                    if (o === null || typeof o !== 'object') continue;
+                    if (seen.has(o)) return false;
+                    seen.add(o);
+                    for (const v of Object.values(o)) stack.push(v);
+                }
+                return true;
+            };
             console.log = function(...args) {
                 try {
                     const serial = args.map(a => {
-                        try { return JSON.parse(JSON.stringify(a)); }
-                        catch (e) { try { return String(a); } catch { return null; } }
+                        try {
+                            if (!isTree(a)) throw new Error('not a tree');
+                            return clone(a);
+                        }
+                        catch (e) {
+                            try { return JSON.parse(JSON.stringify(a)); }
+                            catch (e2) { try { return String(a); } catch { return null; } }
+                        }
                     });
                     window.__captured_console.push(serial);
                 } catch (e) { }
@@ -105,98 +247,83 @@ async def run_playwright(args):
         async def on_console(msg):
             # Try to extract JSON-serializable args via json_value
             for arg in msg.args:
+                if finder.found is not None:
+                    return
                 try:
-                    val = await arg.json_value()
-                    captured.append(val)
+                    finder.feed(await arg.json_value())
                 except Exception:
                     # fallback to text
                     try:
-                        captured.append(msg.text)
+                        finder.feed(msg.text)
                     except Exception:
                         pass
 
         page.on("console", on_console)
+        await page.route("**/*", block_subresources)
         print("Opening page...")
-        await page.goto(args.url, wait_until="networkidle")
-
-        # give some extra time for scripts that run after load
-        await asyncio.sleep(2)
-
-        # after navigation and a short wait, pull captured console messages
-        await asyncio.sleep(1)
+        # the console wrapper is installed before any script runs, so there is
+        # no need to wait for the network to go idle
+        await page.goto(args.url, wait_until="domcontentloaded")
+
+        # scripts that run after load may log later; wait until something
+        # payload-sized has been captured rather than sleeping a fixed time.
+        # The page only records console.log, so also stop as soon as the
+        # console handler has found the list (e.g. via console.info).
+        if finder.found is None:
+            page_wait = asyncio.ensure_future(page.wait_for_function(
+                """() => (window.__captured_console || []).some(a => {
+                    try { return JSON.stringify(a).length > 500; } catch (e) { return false; }
+                })""",
+                timeout=10_000,
+                polling=200,
+            ))
+            found_wait = asyncio.ensure_future(finder.done.wait())
+            await asyncio.wait({page_wait, found_wait}, return_when=asyncio.FIRST_COMPLETED)
+            for task in (page_wait, found_wait):
+                task.cancel()
+            results = await asyncio.gather(page_wait, found_wait, return_exceptions=True)
+            err = results[0]
+            if isinstance(err, Exception) and not isinstance(err, PlaywrightTimeoutError):
+                raise err
 
         # read captured console logs from the page
-        try:
-            captured_from_page = await page.evaluate("() => window.__captured_console || []")
-            # extend our captured list with any new captures
-            if isinstance(captured_from_page, list):
-                captured.extend(captured_from_page)
-        except Exception:
-            pass
+        if finder.found is None:
+            try:
+                captured_from_page = await page.evaluate("() => window.__captured_console || []")
+                if isinstance(captured_from_page, list):
+                    for item in captured_from_page:
+                        finder.feed(item)
+            except Exception:
+                pass
 
         await browser.close()
 
-    # look through captured items for a company list
-    companies_list = None
-    for item in captured:
-        if item is None:
-            continue
-        found = find_companies_list(item)
-        if found:
-            companies_list = found
-            break
+    companies_list = finder.found
 
     # Diagnostic: print capture summary to help debug when no direct match is found
     if companies_list is None:
-        print(f"Captured {len(captured)} console entries. Inspecting for large arrays of dicts...")
-        # find the largest list whose elements are dict-like
-        best = None
-        best_len = 0
-        for idx, item in enumerate(captured):
-            # item might be a list of args (e.g., ["label", [...objects...]
-            # or nested lists/objects. Traverse to find inner lists.
-            def walk(o):
-                if isinstance(o, list):
-                    # if it's a list of dicts
-                    if o and all(isinstance(x, dict) for x in o):
-                        return o
-                    for sub in o:
-                        res = walk(sub)
-                        if res:
-                            return res
-                if isinstance(o, dict):
-                    for v in o.values():
-                        res = walk(v)
-                        if res:
-                            return res
-                return None
-
-            candidate = walk(item)
-            if candidate and len(candidate) > best_len:
-                best = candidate
-                best_len = len(candidate)
-
-        if best:
-            print(f"Found candidate list with {best_len} items (using fallback).")
-            companies_list = best
+        print(f"Captured {finder.count} console entries. Inspecting for large arrays of dicts...")
+        if finder.largest:
+            print(f"Found candidate list with {len(finder.largest)} items (using fallback).")
+            companies_list = finder.largest
 
     if companies_list is None:
         # also check if any captured item is a JSON string that can be parsed
-        for item in captured:
-            if isinstance(item, str):
-                try:
-                    obj = json.loads(item)
-                except Exception:
-                    continue
-                found = find_companies_list(obj)
-                if found:
-                    companies_list = found
-                    break
+        companies_list = finder.from_text
 
     if not companies_list:
         print("No company list found in console messages.")
         return
 
+    if args.pipeline:
+        # hand the parsed dicts to the splitter; no CSV/JSON round trip
+        records = [c for c in companies_list if isinstance(c, dict)]
+        if not records:
+            print("Found company list but no valid dicts inside.")
+            return
+        split_by_sector.split(records, split_by_sector.OUT_DIR)
+        return
+
     companies = [normalize_company(c) for c in companies_list if isinstance(c, dict)]
     if not companies:
         print("Found company list but no valid dicts inside.")
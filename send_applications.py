@@ -14,12 +14,18 @@ The script is conservative by default: use --dry-run to preview recipients and o
 before actually sending emails. It logs successes/failures to `sent_log.csv`.
 """
 import os
+import re
 import csv
+import string
+import uuid
 import time
+import asyncio
 import argparse
 import smtplib
 import ssl
-from email.message import EmailMessage
+from email.message import EmailMessage, MIMEPart
+from email.policy import SMTP as SMTP_POLICY
+from email.utils import getaddresses
 from typing import List
 import socket
 try:
@@ -28,6 +34,11 @@ try:
 except Exception:
     # dotenv is optional; if it's not installed the code will still use env vars
     pass
+try:
+    import aiosmtplib
+except ImportError:
+    # aiosmtplib is optional; without it emails are sent sequentially with smtplib
+    aiosmtplib = None
 
 
 def test_smtp_connection(server: str, port: int, timeout: float = 5.0):
@@ -65,30 +76,24 @@ def load_recipients(csv_path: str) -> List[dict]:
 
     The returned dicts keep original CSV column names so templates can use them.
     """
-    recipients = []
-    with open(csv_path, newline='', encoding='utf-8') as f:
+    # single pass: skip rows without an email and dedupe by email preserving order
+    seen = set()
+    out = []
+    with open(csv_path, newline='', encoding='utf-8', buffering=1 << 20) as f:
         reader = csv.DictReader(f)
         for r in reader:
-            email = (r.get('EntrepriseContactEmail') or r.get('EntrepriseContactEmail'.lower()) or '').strip()
-            if not email:
+            email = (r.get('EntrepriseContactEmail') or r.get('entreprisecontactemail') or '').strip()
+            key = email.lower()
+            if not email or key in seen:
                 continue
+            seen.add(key)
             # normalize keys: keep as-is but ensure common accessors
             row = {k: (v or '') for k, v in r.items()}
             # also expose short aliases
             row['email'] = email
-            row['company'] = row.get('EntrepriseName', row.get('EntrepriseName'.lower(), ''))
-            row['contact'] = row.get('EntrepriseContactName', row.get('EntrepriseContactName'.lower(), ''))
-            recipients.append(row)
-
-    # dedupe by email preserving order
-    seen = set()
-    out = []
-    for r in recipients:
-        e = r['email'].lower()
-        if e in seen:
-            continue
-        seen.add(e)
-        out.append(r)
+            row['company'] = row.get('EntrepriseName', row.get('entreprisename', ''))
+            row['contact'] = row.get('EntrepriseContactName', row.get('entreprisecontactname', ''))
+            out.append(row)
     return out
 
 
@@ -103,25 +108,75 @@ DEFAULT_BODY = os.getenv('BODY_TEMPLATE') or (
 )
 
 
-def create_message(from_addr: str, to_addr: str, subject: str, body: str, cv_path: str) -> EmailMessage:
+def load_attachment(cv_path: str) -> bytes:
+    """Read, encode and serialize the CV part once; every message reuses the bytes."""
+    try:
+        with open(cv_path, 'rb') as f:
+            data = f.read()
+        maintype = 'application'
+        subtype = 'pdf'
+        filename = os.path.basename(cv_path)
+        part = MIMEPart()
+        part.set_content(data, maintype=maintype, subtype=subtype, disposition='attachment', filename=filename)
+        return part.as_bytes(policy=SMTP_POLICY)
+    except Exception as e:
+        raise RuntimeError(f"Failed to attach CV: {e}")
+
+
+def envelope_addresses(from_addr: str, to_addr: str) -> tuple:
+    """Return (sender, recipients) parsed from the From/To values, as send_message does.
+
+    Display names are dropped and a comma-separated To value yields several recipients.
+    """
+    senders = getaddresses([from_addr or ''])
+    sender = senders[0][1] if senders else ''
+    recipients = [addr for _, addr in getaddresses([to_addr or '']) if addr]
+    return sender, recipients
+
+
+def needs_smtputf8(sender: str, recipients: list) -> bool:
+    # same check smtplib's send_message does before asserting SMTPUTF8
+    return not ''.join([sender, *recipients]).isascii()
+
+
+def smtp_mail_options(sender: str, recipients: list) -> list:
+    return ['SMTPUTF8', 'BODY=8BITMIME'] if needs_smtputf8(sender, recipients) else []
+
+
+def create_message(from_addr: str, to_addr: str, subject: str, body: str, attachment: bytes = None) -> tuple:
+    """Serialize the per-recipient parts of one message.
+
+    Only the headers and text body are serialized here. Returns `(head, tail)`,
+    the bytes on either side of where the pre-serialized attachment from
+    `load_attachment` goes; `join_message` builds the wire bytes right before
+    sending so queued messages don't each hold a copy of the CV.
+    """
     msg = EmailMessage()
     msg['From'] = from_addr
     msg['To'] = to_addr
     msg['Subject'] = subject
     msg.set_content(body)
 
-    if cv_path:
-        try:
-            with open(cv_path, 'rb') as f:
-                data = f.read()
-            maintype = 'application'
-            subtype = 'pdf'
-            filename = os.path.basename(cv_path)
-            msg.add_attachment(data, maintype=maintype, subtype=subtype, filename=filename)
-        except Exception as e:
-            raise RuntimeError(f"Failed to attach CV: {e}")
+    # non-ASCII addresses are sent with SMTPUTF8, as send_message would
+    international = needs_smtputf8(*envelope_addresses(from_addr, to_addr))
+    policy = SMTP_POLICY.clone(utf8=True) if international else SMTP_POLICY
+
+    if attachment is None:
+        return msg.as_bytes(policy=policy), b''
+
+    boundary = '=' * 15 + uuid.uuid4().hex[:19] + '=='
+    msg.make_mixed()
+    msg.set_boundary(boundary)
+    data = msg.as_bytes(policy=policy)
+    closing = data.rindex(f'\r\n--{boundary}--'.encode('ascii'))
+    return data[:closing] + f'\r\n--{boundary}\r\n'.encode('ascii'), data[closing:]
+
 
-    return msg
+def join_message(parts: tuple, attachment: bytes = None) -> bytes:
+    head, tail = parts
+    if attachment is None:
+        return head + tail
+    return b''.join((head, attachment, tail))
 
 
 class SafeDict(dict):
@@ -129,19 +184,151 @@ class SafeDict(dict):
         return ''
 
 
-def send_smtp(server: str, port: int, user: str, password: str, msg: EmailMessage, use_tls=True):
+_FIELD_RE = re.compile(r"\{\{|\}\}|\{([_a-zA-Z][_a-zA-Z0-9]*)\}|[{}]")
+
+
+def compile_template(template: str):
+    """Convert a `str.format` template using plain `{name}` fields to a string.Template.
+
+    Returns None if the template uses anything string.Template can't express
+    (format specs, attribute or index lookups); callers then use `format_map`.
+    """
+    unsupported = False
+
+    def repl(m):
+        nonlocal unsupported
+        tok = m.group(0)
+        if tok == '{{':
+            return '{'
+        if tok == '}}':
+            return '}'
+        if m.group(1):
+            return '${' + m.group(1) + '}'
+        unsupported = True
+        return tok
+
+    converted = _FIELD_RE.sub(repl, template.replace('$', '$$'))
+    return None if unsupported else string.Template(converted)
+
+
+def render_template(template: str, compiled, ctx: SafeDict) -> str:
+    # SafeDict makes missing placeholders render as '' in both paths
+    if compiled is None:
+        return template.format_map(ctx)
+    return compiled.safe_substitute(ctx)
+
+
+def connect_smtp(server: str, port: int, user: str, password: str, use_tls=True) -> smtplib.SMTP:
     context = ssl.create_default_context()
     if use_tls:
-        with smtplib.SMTP(server, port, timeout=60) as smtp:
+        smtp = smtplib.SMTP(server, port, timeout=60)
+    else:
+        smtp = smtplib.SMTP_SSL(server, port, context=context, timeout=60)
+    try:
+        if use_tls:
             smtp.starttls(context=context)
-            if user and password:
-                smtp.login(user, password)
-            smtp.send_message(msg)
+        if user and password:
+            smtp.login(user, password)
+    except Exception:
+        smtp.close()
+        raise
+    return smtp
+
+
+def send_smtp(smtp: smtplib.SMTP, from_addr: str, to_addr: str, msg: bytes, reconnect) -> smtplib.SMTP:
+    """Send `msg` on an open connection, reconnecting once if the server dropped it.
+
+    Returns the connection to use for the next message.
+    """
+    sender, recipients = envelope_addresses(from_addr, to_addr)
+    mail_options = smtp_mail_options(sender, recipients)
+    try:
+        smtp.sendmail(sender, recipients, msg, mail_options)
+    except smtplib.SMTPServerDisconnected:
+        smtp = reconnect()
+        smtp.sendmail(sender, recipients, msg, mail_options)
+    return smtp
+
+
+def describe_send_error(e: Exception) -> str:
+    # Common DNS-resolution socket error
+    if isinstance(e, socket.gaierror):
+        return f"DNS resolution failed for SMTP server: {e}"
+    return str(e)
+
+
+async def open_smtp_async(server: str, port: int, user: str, password: str, use_tls=True):
+    context = ssl.create_default_context()
+    if use_tls:
+        client = aiosmtplib.SMTP(hostname=server, port=port, timeout=60, start_tls=True, tls_context=context)
     else:
-        with smtplib.SMTP_SSL(server, port, context=context, timeout=60) as smtp:
-            if user and password:
-                smtp.login(user, password)
-            smtp.send_message(msg)
+        client = aiosmtplib.SMTP(hostname=server, port=port, timeout=60, use_tls=True, tls_context=context)
+    await client.connect()
+    if user and password:
+        await client.login(user, password)
+    return client
+
+
+async def send_smtp_async(client, from_addr: str, to_addr: str, msg: bytes):
+    sender, recipients = envelope_addresses(from_addr, to_addr)
+    await client.sendmail(sender, recipients, msg, mail_options=smtp_mail_options(sender, recipients))
+
+
+async def send_all_async(outbox: list, attachment: bytes, from_addr: str, server: str, port: int, user: str,
+                         password: str, use_tls: bool, connections: int, delay: float, log_writer):
+    """Send prepared (to_addr, company, parts) tuples over a pool of persistent connections.
+
+    Each connection is throttled by `delay` independently, so up to `connections`
+    messages are in flight at once. `parts` come from `create_message` and are
+    joined with `attachment` only once a connection is free.
+    """
+    count = max(1, min(connections, len(outbox)))
+    results = await asyncio.gather(
+        *[open_smtp_async(server, port, user, password, use_tls) for _ in range(count)],
+        return_exceptions=True,
+    )
+    clients = [c for c in results if not isinstance(c, BaseException)]
+    if not clients:
+        err_str = describe_send_error(results[0])
+        print(f"Failed to open SMTP connection: {err_str}")
+        for to_addr, company, _ in outbox:
+            if log_writer:
+                log_writer.writerow([to_addr, company, 'error', err_str])
+        return
+
+    # the queue hands out idle connections and bounds concurrency to the pool size
+    pool = asyncio.Queue()
+    for c in clients:
+        pool.put_nowait(c)
+
+    async def send_one(to_addr: str, company: str, parts: tuple):
+        client = await pool.get()
+        try:
+            msg = join_message(parts, attachment)
+            try:
+                await send_smtp_async(client, from_addr, to_addr, msg)
+            except aiosmtplib.SMTPServerDisconnected:
+                client = await open_smtp_async(server, port, user, password, use_tls)
+                await send_smtp_async(client, from_addr, to_addr, msg)
+            print(f"Sent: {to_addr}")
+            if log_writer:
+                log_writer.writerow([to_addr, company, 'sent', ''])
+        except Exception as e:
+            err_str = describe_send_error(e)
+            print(f"Failed to send to {to_addr}: {err_str}")
+            if log_writer:
+                log_writer.writerow([to_addr, company, 'error', err_str])
+        await asyncio.sleep(delay)
+        pool.put_nowait(client)
+
+    try:
+        await asyncio.gather(*[send_one(*item) for item in outbox])
+    finally:
+        while not pool.empty():
+            try:
+                await pool.get_nowait().quit()
+            except Exception:
+                pass
 
 
 def main():
@@ -153,7 +340,9 @@ def main():
     parser.add_argument('--subject', default=os.getenv('SUBJECT', 'Intérêt pour votre entreprise'), help='Email subject')
     parser.add_argument('--body-template', default=os.getenv('BODY_TEMPLATE', None), help='Body template (Python format) - placeholders from CSV columns')
     parser.add_argument('--list-vars', action='store_true', help='List available template variables from the CSV and exit')
-    parser.add_argument('--delay', type=float, default=2.0, help='Seconds to wait between emails')
+    parser.add_argument('--delay', type=float, default=2.0, help='Seconds to wait between emails (per connection)')
+    parser.add_argument('--connections', type=int, default=3, help='Number of parallel SMTP connections')
+    parser.add_argument('--sequential', action='store_true', help='Send one email at a time with smtplib')
     parser.add_argument('--dry-run', action='store_true', help='Do not actually send emails; print preview')
     parser.add_argument('--smtp-server', help='SMTP server (or set SMTP_SERVER env)')
     parser.add_argument('--smtp-port', type=int, help='SMTP port (or set SMTP_PORT env)')
@@ -248,34 +437,57 @@ def main():
         log_f = None
         log_writer = None
 
+    sequential = args.sequential or aiosmtplib is None
+    if not args.dry_run and not args.sequential and aiosmtplib is None:
+        print('aiosmtplib not installed; sending sequentially.')
+
+    # Only attach CV if file exists. This prevents dry-run failures when CV is not present.
+    attachment = None
+    if args.cv and os.path.exists(args.cv):
+        try:
+            attachment = load_attachment(args.cv)
+        except Exception as e:
+            print(f'Failed to prepare CV attachment: {e}')
+            if log_f:
+                log_f.close()
+            return
+    elif args.cv:
+        print(f"Warning: CV not found at {args.cv}; proceeding without attachment for preview/dry-run.")
+
+    def connect():
+        return connect_smtp(smtp_server, smtp_port, smtp_user, smtp_pass, use_tls=not args.no_tls)
+
+    # Body and subject templates are the same for every recipient; compile them once.
+    # Prefer user-provided template, fallback to default template
+    template = args.body_template or DEFAULT_BODY
+    compiled_body = compile_template(template)
+    base_subject = args.subject or os.getenv('SUBJECT') or 'Intérêt pour votre entreprise'
+    compiled_subject = compile_template(base_subject)
+
+    # one connection (TLS handshake + AUTH) is shared by every sequential send
+    smtp = None
+    outbox = []
     for r in recipients:
         contact_name = r['contact'] or ''
         company = r['company'] or ''
         to_addr = r['email']
 
-        # Render body: prefer user-provided template, fallback to default template
-        template = args.body_template or DEFAULT_BODY
+        # Render body
         ctx = SafeDict({k: (v or '') for k, v in r.items()})
         # ensure common aliases exist
         ctx.setdefault('contact_name', contact_name or company)
         ctx.setdefault('company', company or '')
         ctx.setdefault('your_name', args.your_name)
         try:
-            body = template.format_map(ctx)
+            body = render_template(template, compiled_body, ctx)
         except Exception as e:
             print(f'Failed to render template for {to_addr}: {e}. Using fallback body.')
             body = DEFAULT_BODY.format(contact_name=contact_name or company, company=company or '', your_name=args.your_name)
 
-        # Only attach CV if file exists. This prevents dry-run failures when CV is not present.
-        attach_cv = args.cv if args.cv and os.path.exists(args.cv) else None
-        if args.cv and not attach_cv:
-            print(f"Warning: CV not found at {args.cv}; proceeding without attachment for preview/dry-run.")
-
         # Personalize and format subject using the same template context so env SUBJECT can use {sector}, {company}, etc.
-        base_subject = args.subject or os.getenv('SUBJECT') or 'Intérêt pour votre entreprise'
         try:
             # Format with SafeDict to avoid KeyError on missing placeholders
-            formatted_subject = base_subject.format_map(ctx if isinstance(ctx, dict) else dict(ctx))
+            formatted_subject = render_template(base_subject, compiled_subject, ctx)
         except Exception:
             formatted_subject = base_subject
         # If the original template didn't include {company} and we have a company, append it for clarity
@@ -285,7 +497,7 @@ def main():
             subject_for_recipient = formatted_subject
 
         try:
-            msg = create_message(from_email, to_addr, subject_for_recipient, body, attach_cv)
+            parts = create_message(from_email, to_addr, subject_for_recipient, body, attachment)
         except Exception as e:
             print(f'Failed to prepare message for {to_addr}: {e}')
             if log_writer:
@@ -296,22 +508,35 @@ def main():
         if args.dry_run:
             continue
 
+        if not sequential:
+            outbox.append((to_addr, company, parts))
+            continue
+
         try:
-            send_smtp(smtp_server, smtp_port, smtp_user, smtp_pass, msg, use_tls=not args.no_tls)
+            if smtp is None:
+                smtp = connect()
+            smtp = send_smtp(smtp, from_email, to_addr, join_message(parts, attachment), connect)
             print(f"Sent: {to_addr}")
             if log_writer:
                 log_writer.writerow([to_addr, company, 'sent', ''])
         except Exception as e:
-            err_str = str(e)
-            # Common DNS-resolution socket error
-            if isinstance(e, socket.gaierror):
-                err_str = f"DNS resolution failed for SMTP server: {e}"
+            err_str = describe_send_error(e)
             print(f"Failed to send to {to_addr}: {err_str}")
             if log_writer:
                 log_writer.writerow([to_addr, company, 'error', err_str])
 
         time.sleep(args.delay)
 
+    if smtp is not None:
+        try:
+            smtp.quit()
+        except Exception:
+            pass
+
+    if outbox:
+        asyncio.run(send_all_async(outbox, attachment, from_email, smtp_server, smtp_port, smtp_user,
+                                   smtp_pass, not args.no_tls, args.connections, args.delay, log_writer))
+
     if log_f:
         log_f.close()
 
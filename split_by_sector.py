@@ -12,19 +12,38 @@ Usage:
 Output: files named like `sector_<sanitized_sector>.csv` in the same folder.
 """
 import csv
+import functools
 import json
 import os
 import re
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    # orjson is optional; fall back to the stdlib json module
+    json_loads = json.loads
 
 INPUT = "companies.csv"
 OUT_DIR = "by_sector"
 
+FIELDNAMES = [
+    'EntrepriseName', 'EntrepriseVille', 'EntrepriseTechnologie',
+    'EntrepriseContactSiteWeb', 'EntrepriseContactPhone', 'EntrepriseContactName',
+    'EntrepriseContactEmail', 'EntrepriseLogo', 'Activite', 'EntrepriseSecteurActivite'
+]
+
+_SPLIT_RE = re.compile(r"[;,]")
+_WS_RE = re.compile(r"\s+")
+_SAFE_RE = re.compile(r"[^a-z0-9_\-]")
+
 
+@functools.lru_cache(maxsize=4096)
 def sanitize_filename(s: str) -> str:
     s = s.strip().lower()
-    s = re.sub(r"\s+", "_", s)
-    s = re.sub(r"[^a-z0-9_\-]", "", s)
+    s = _WS_RE.sub("_", s)
+    s = _SAFE_RE.sub("", s)
     return s[:120] or "unknown"
 
 
@@ -33,11 +52,11 @@ def parse_raw(raw: str) -> dict:
         return {}
     try:
         # raw should already be a JSON text; load it
-        return json.loads(raw)
+        return json_loads(raw)
     except Exception:
         # sometimes raw might be double-encoded (string containing JSON string)
         try:
-            return json.loads(raw.strip('"'))
+            return json_loads(raw.strip('"'))
         except Exception:
             return {}
 
@@ -58,50 +77,92 @@ def important_fields(obj: dict) -> dict:
     }
 
 
-def main():
-    if not os.path.exists(INPUT):
-        print(f"{INPUT} not found in current folder.")
-        return
+def _quote(v) -> str:
+    # same output as csv.writer's default (excel) dialect with QUOTE_MINIMAL
+    if not isinstance(v, str):
+        v = str(v)
+    if '"' in v:
+        return '"' + v.replace('"', '""') + '"'
+    if ',' in v or '\n' in v or '\r' in v:
+        return '"' + v + '"'
+    return v
+
+
+def write_sector(job) -> tuple:
+    out_path, rows = job
+    # build the whole file in memory and hand it to the OS in one write
+    lines = [','.join(FIELDNAMES)]
+    lines.extend(','.join([_quote(v) for v in row]) for row in rows)
+    data = memoryview(('\r\n'.join(lines) + '\r\n').encode('utf-8'))
+    # O_BINARY keeps Windows from translating the \r\n line endings again
+    fd = os.open(out_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+    try:
+        while data:
+            data = data[os.write(fd, data):]
+    finally:
+        os.close(fd)
+    return out_path, len(rows)
+
+
+def read_companies(path: str):
+    """Yield the parsed `raw` JSON of every row in the scraper's CSV."""
+    with open(path, newline='', encoding='utf-8', buffering=1 << 20) as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        # only the `raw` column is needed; look its position up once
+        raw_idx = header.index('raw') if 'raw' in header else None
+        for row in reader:
+            raw = row[raw_idx] if raw_idx is not None and raw_idx < len(row) else None
+            yield parse_raw(raw) if raw else {}
+
 
-    os.makedirs(OUT_DIR, exist_ok=True)
+def split(companies, out_dir: str = OUT_DIR):
+    """Write one CSV per sector from parsed company dicts.
+
+    `companies` can come from `read_companies` or straight from the scraper,
+    which skips the companies.csv encode/decode round trip.
+    """
+    os.makedirs(out_dir, exist_ok=True)
 
     sectors = defaultdict(list)
 
-    with open(INPUT, newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            raw = row.get('raw')
-            parsed = parse_raw(raw) if raw else {}
-            rec = important_fields(parsed)
-
-            sector_field = rec.get('EntrepriseSecteurActivite') or ''
-            if not sector_field:
-                sectors['NO_SECTEUR'].append(rec)
-                continue
-
-            # sector_field may contain multiple sectors separated by ';'
-            parts = [p.strip() for p in re.split(r"[;,]", sector_field) if p.strip()]
-            if not parts:
-                sectors['NO_SECTEUR'].append(rec)
-            else:
-                for s in parts:
-                    sectors[s].append(rec)
-
-    # Write per-sector CSVs
+    for parsed in companies:
+        rec = important_fields(parsed)
+        # build the output row once; a company listed under several sectors
+        # shares it across buckets
+        row = [rec[k] for k in FIELDNAMES]
+
+        sector_field = rec['EntrepriseSecteurActivite']
+        if not sector_field:
+            sectors['NO_SECTEUR'].append(row)
+            continue
+
+        # sector_field may contain multiple sectors separated by ';'
+        parts = [p for p in (x.strip() for x in _SPLIT_RE.split(sector_field)) if p]
+        if not parts:
+            sectors['NO_SECTEUR'].append(row)
+        else:
+            for s in parts:
+                sectors[s].append(row)
+
+    # Write per-sector CSVs. Each file is independent, so write them concurrently;
+    # sectors that sanitize to the same filename keep the last one, as a serial
+    # loop would.
+    jobs = {}
     for sector, rows in sectors.items():
         safe = sanitize_filename(sector)
-        out_path = os.path.join(OUT_DIR, f"sector_{safe}.csv")
-        fieldnames = [
-            'EntrepriseName', 'EntrepriseVille', 'EntrepriseTechnologie',
-            'EntrepriseContactSiteWeb', 'EntrepriseContactPhone', 'EntrepriseContactName',
-            'EntrepriseContactEmail', 'EntrepriseLogo', 'Activite', 'EntrepriseSecteurActivite'
-        ]
-        with open(out_path, 'w', encoding='utf-8', newline='') as outf:
-            writer = csv.DictWriter(outf, fieldnames=fieldnames)
-            writer.writeheader()
-            for r in rows:
-                writer.writerow({k: r.get(k, '') for k in fieldnames})
-        print(f"Wrote {len(rows)} rows to {out_path}")
+        jobs[os.path.join(out_dir, f"sector_{safe}.csv")] = rows
+    with ThreadPoolExecutor(max_workers=8) as ex:
+        for out_path, count in ex.map(write_sector, jobs.items()):
+            print(f"Wrote {count} rows to {out_path}")
+
+
+def main():
+    if not os.path.exists(INPUT):
+        print(f"{INPUT} not found in current folder.")
+        return
+
+    split(read_companies(INPUT), OUT_DIR)
 
 
 if __name__ == '__main__':